@@ -6,8 +6,22 @@ and handling track data.
 """
 
 import datetime
+import threading
+import time
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional, Tuple, Any
-import dateutil.parser
+
+# Maximum number of album IDs accepted by the Spotify "Get Several Albums" endpoint
+ALBUMS_BATCH_SIZE = 20
+# Maximum number of track IDs accepted by the Spotify "Get Several Tracks" endpoint
+TRACKS_BATCH_SIZE = 50
+# Maximum page size accepted by the Spotify "Get Artist's Albums" endpoint
+ARTIST_ALBUMS_PAGE_SIZE = 50
+# Maximum number of playlist pages fetched concurrently
+PLAYLIST_PAGE_WORKERS = 8
+# Number of seconds a cached artist album listing is considered fresh
+ALBUM_CACHE_MAX_AGE = 6 * 60 * 60
 
 class MultipleArtistsFoundError(Exception):
     """Raised when multiple artists are found with the same name."""
@@ -17,13 +31,110 @@ class NoArtistsFoundError(Exception):
     """Raised when no artists are found with the given name."""
     pass
 
-def get_recent_track(sp: Any, artist: Dict[str, Any], n_days_ago: int) -> Tuple[List[Tuple[str, str, str, Optional[str], Optional[str]]], Optional[Tuple[str, str, str, Optional[str], Optional[str]]]]:
+class RateLimiter:
+    """Token bucket limiting the rate of Spotify API calls across threads.
+    
+    Tokens refill continuously at `rate` per second up to a burst of `rate`.
+    A pause (e.g. from a 429 Retry-After header) blocks every caller until it ends.
+    """
+    
+    def __init__(self, rate: float = 10):
+        self.rate = rate
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+    
+    def acquire(self) -> None:
+        """Block until a call is allowed."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+    
+    def pause(self, seconds: float) -> None:
+        """Block all calls for the given number of seconds."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+    
+    def __enter__(self) -> 'RateLimiter':
+        self.acquire()
+        return self
+    
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+class RateLimitedSpotify:
+    """Wrapper around a Spotipy client that passes every call through a RateLimiter.
+    
+    When Spotify responds with HTTP 429, the limiter is paused for the
+    Retry-After period, so all threads back off together, and the call is retried.
+    """
+    
+    def __init__(self, sp: Any, limiter: Optional[RateLimiter] = None, max_retries: int = 3):
+        self._sp = sp
+        self._limiter = limiter or RateLimiter()
+        self._max_retries = max_retries
+    
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._sp, name)
+        if not callable(attr):
+            return attr
+        
+        def call(*args: Any, **kwargs: Any) -> Any:
+            for attempt in range(self._max_retries + 1):
+                with self._limiter:
+                    try:
+                        return attr(*args, **kwargs)
+                    except Exception as e:
+                        if getattr(e, 'http_status', None) != 429 or attempt == self._max_retries:
+                            raise
+                        headers = getattr(e, 'headers', None) or {}
+                        self._limiter.pause(int(headers.get('Retry-After', 1)))
+        return call
+
+def normalize_release_date(release_date: str) -> str:
+    """Pad a Spotify release date, which may only have year or month precision.
+    
+    Full ISO dates compare lexicographically in date order, so the result can
+    be compared against other ISO date strings without parsing it.
+    
+    Args:
+        release_date: A release date formatted as 'YYYY-MM-DD', 'YYYY-MM' or 'YYYY'
+    
+    Returns:
+        The release date as 'YYYY-MM-DD', defaulting to the first month and day when missing
+    """
+    if len(release_date) == 4:
+        return release_date + '-01-01'
+    if len(release_date) == 7:
+        return release_date + '-01'
+    return release_date
+
+def get_recent_track(sp: Any, artist: Dict[str, Any], n_days_ago: int, track_durations: Optional[Dict[str, int]] = None, album_cache: Optional[Dict[str, Any]] = None, album_tracks_cache: Optional[Dict[str, List[List[str]]]] = None) -> Tuple[List[Tuple[str, str, str, Optional[str], Optional[str]]], Optional[Tuple[str, str, str, Optional[str], Optional[str]]]]:
     """Get recent tracks from an artist released within a specified time period.
     
     Args:
         sp: Spotify API client instance
         artist: Artist information dictionary containing at least 'spotify_id' key
         n_days_ago: Number of days to look back for recent releases
+        track_durations: Optional dictionary mapping track IDs to durations in
+                         milliseconds, filled in with every track fetched
+        album_cache: Optional dictionary mapping artist IDs to their cached album
+                     release dates; fresh entries are used instead of fetching the
+                     artist's albums, stale or missing entries are refreshed
+        album_tracks_cache: Optional dictionary mapping album IDs to their cached
+                            [track_id, name] listings; only albums missing from it
+                            are fetched, and their listings are added to it
     
     Returns:
         A tuple containing:
@@ -37,72 +148,120 @@ def get_recent_track(sp: Any, artist: Dict[str, Any], n_days_ago: int) -> Tuple[
     # Validate artist has required spotify_id
     if 'spotify_id' not in artist:
         raise KeyError(f"Artist dictionary missing required 'spotify_id' key: {artist.get('name', 'Unknown')}")
-    # Get the artist's albums and singles
-    try:
-        albums = sp.artist_albums(artist['spotify_id'], album_type='album,single', country='US')
-    except Exception as e:
-        print(f"Error fetching albums for artist {artist.get('name', 'Unknown')}: {e}")
-        return [], None
+    
+    # These are constant for every track of the artist
+    spotify_id = artist['spotify_id']
+    threads = artist.get('threads')
+    artist_name = artist.get('name')
+    
+    # ISO date strings, compared directly against the normalized release dates
+    current_date = datetime.date.today()
+    today = current_date.isoformat()
+    day_n_days_ago = (current_date - datetime.timedelta(days=n_days_ago)).isoformat()
+    beginning_of_year = datetime.date(current_date.year, 1, 1).isoformat()
+    # Early in January the recent period reaches back into the previous year
+    earliest_release_date = min(beginning_of_year, day_n_days_ago)
+    
+    # Get the artist's albums and singles, from the cache when it is fresh enough
+    cache_entry = album_cache.get(spotify_id) if album_cache is not None else None
+    if cache_entry and time.time() - cache_entry.get('fetched_at', 0) < ALBUM_CACHE_MAX_AGE:
+        albums = [
+            {'id': album_id, 'release_date': release_date}
+            for album_id, release_date in cache_entry['albums'].items()
+        ]
+    else:
+        try:
+            albums = []
+            # Releases come newest first within each album type, so fetch albums and
+            # singles separately and stop paging each once it passes the earliest date
+            for album_type in ('album', 'single'):
+                results = sp.artist_albums(spotify_id, album_type=album_type, country='US', limit=ARTIST_ALBUMS_PAGE_SIZE)
+                albums.extend(results['items'])
+                while results['next'] and results['items'] and (
+                    normalize_release_date(results['items'][-1]['release_date']) >= earliest_release_date
+                ):
+                    results = sp.next(results)
+                    albums.extend(results['items'])
+        except Exception as e:
+            print(f"Error fetching albums for artist {artist.get('name', 'Unknown')}: {e}")
+            return [], None
+        if album_cache is not None:
+            album_cache[spotify_id] = {
+                'fetched_at': time.time(),
+                'albums': {album['id']: album['release_date'] for album in albums}
+            }
     
     # Loop through the albums
     all_tracks = []
     latest_track = None
-    today = datetime.date.today()
-    day_n_days_ago = today - datetime.timedelta(days=n_days_ago)
-    beginning_of_year = datetime.date(today.year, 1, 1)
     
-    for album in albums['items']:
+    # First pass: find the albums released this year or in the recent period
+    qualifying_albums = []
+    for album in albums:
         # Get the album release date
         try:
-            release_date = dateutil.parser.parse(album['release_date']).date()
+            release_date = normalize_release_date(album['release_date'])
         except TypeError as e:
             print(f"Error parsing release date for album {album.get('name', 'Unknown')}: {e}")
             continue
         
-        # Check if the album was released in the relevant time period
-        if day_n_days_ago <= release_date <= today:
-            # Get the album tracks
-            try:
-                tracks = sp.album_tracks(album['id'])
-
-
-                for track in tracks['items']:
-                    # Store track info as a tuple
-                    track_info = (
-                        track['id'],
-                        track['name'],
-                        album['release_date'],
-                        artist.get('threads'),
-                        artist.get('name')
-                    )
-                    
-                    # Save the first track as the latest track
-                    if not latest_track:
-                        latest_track = track_info
-                        
-                    all_tracks.append(track_info)
-            except Exception as e:
-                print(f"Error processing track from album {album.get('name', 'Unknown')}: {e}")
+        # Keep relevant albums, noting whether they are recent and/or from this year
+        if earliest_release_date <= release_date <= today:
+            qualifying_albums.append((
+                album,
+                release_date >= day_n_days_ago,
+                release_date >= beginning_of_year
+            ))
+    
+    # Second pass: fetch the track listings of qualifying albums not seen before, in batches
+    album_listings = album_tracks_cache if album_tracks_cache is not None else {}
+    new_albums = [album for album, _, _ in qualifying_albums if album['id'] not in album_listings]
+    for i in range(0, len(new_albums), ALBUMS_BATCH_SIZE):
+        chunk = new_albums[i:i+ALBUMS_BATCH_SIZE]
+        try:
+            full_albums = sp.albums([album['id'] for album in chunk])['albums']
+        except Exception as e:
+            print(f"Error fetching albums for artist {artist.get('name', 'Unknown')}: {e}")
+            continue
+        
+        for album, full_album in zip(chunk, full_albums):
+            if full_album is None:
                 continue
-                
-        elif beginning_of_year <= release_date <= day_n_days_ago:
-            # For tracks released this year but before the recent period
             try:
-                tracks = sp.album_tracks(album['id'])
-                for track in tracks['items']:
-                    all_tracks.append((
-                        track['id'],
-                        track['name'],
-                        album['release_date'],
-                        artist.get('threads'),
-                        artist.get('name')
-                    ))
+                tracks = full_album['tracks']
+                album_tracks = tracks['items']
+                while tracks['next']:
+                    tracks = sp.next(tracks)
+                    album_tracks.extend(tracks['items'])
+                
+                if track_durations is not None:
+                    for track in album_tracks:
+                        track_durations[track['id']] = track['duration_ms']
+                album_listings[album['id']] = [[track['id'], track['name']] for track in album_tracks]
             except Exception as e:
                 print(f"Error processing track from album {album.get('name', 'Unknown')}: {e}")
                 continue
+    
+    # Third pass: build the track list in album order
+    for album, is_recent, is_this_year in qualifying_albums:
+        for track_id, track_name in album_listings.get(album['id'], []):
+            # Store track info as a tuple
+            track_info = (
+                track_id,
+                track_name,
+                album['release_date'],
+                threads,
+                artist_name
+            )
+            
+            # Save the first recent track as the latest track
+            if is_recent and not latest_track:
+                latest_track = track_info
+            
+            # Only releases from this year go into the all tracks list
+            if is_this_year:
+                all_tracks.append(track_info)
 
-    # Sort all tracks by release date (newest first) for consistency
-    all_tracks.sort(key=lambda x: x[2], reverse=True)
     return all_tracks, latest_track
 
 def get_playlist_tracks(sp: Any, playlist_id: str) -> List[Dict[str, Any]]:
@@ -122,13 +281,47 @@ def get_playlist_tracks(sp: Any, playlist_id: str) -> List[Dict[str, Any]]:
         raise ValueError("playlist_id cannot be empty or None")
     results = sp.playlist_tracks(playlist_id)
     tracks = results['items']
-    while results['next']:
-        results = sp.next(results)
-        tracks.extend(results['items'])
+    if not results['next']:
+        return tracks
+    
+    # The first page reveals the total, so fetch the remaining pages concurrently
+    limit = results['limit']
+    offsets = range(limit, results['total'], limit)
+    with ThreadPoolExecutor(max_workers=PLAYLIST_PAGE_WORKERS) as executor:
+        pages = executor.map(
+            lambda offset: sp.playlist_tracks(playlist_id, limit=limit, offset=offset),
+            offsets
+        )
+        for page in pages:
+            tracks.extend(page['items'])
     return tracks
 
+def get_track_durations(sp: Any, track_ids: List[str], track_durations: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """Get the durations of tracks, fetching only the ones not already known.
+    
+    Args:
+        sp: A Spotipy client instance
+        track_ids: The Spotify IDs of the tracks
+        track_durations: Optional dictionary mapping track IDs to durations in
+                         milliseconds; missing tracks are fetched and added to it
+    
+    Returns:
+        A dictionary mapping each track ID to its duration in milliseconds
+    """
+    if track_durations is None:
+        track_durations = {}
+    missing_ids = [track_id for track_id in dict.fromkeys(track_ids) if track_id not in track_durations]
+    for i in range(0, len(missing_ids), TRACKS_BATCH_SIZE):
+        for track in sp.tracks(missing_ids[i:i+TRACKS_BATCH_SIZE])['tracks']:
+            if track:
+                track_durations[track['id']] = track['duration_ms']
+    return {track_id: track_durations[track_id] for track_id in track_ids if track_id in track_durations}
+
 def deduplicate_track_list(tracks: List[Tuple[str, str, str, Optional[str], Optional[str]]]) -> List[Tuple[str, str, str, Optional[str], Optional[str]]]:
-    """Remove duplicate tracks, keeping only the most recent version of each track.
+    """Remove duplicate tracks, keeping a single entry per Spotify track ID.
+    
+    The same track can be collected more than once, e.g. when it is credited
+    to several of the tracked artists.
     
     Args:
         tracks: A list of track tuples where each tuple contains:
@@ -136,25 +329,10 @@ def deduplicate_track_list(tracks: List[Tuple[str, str, str, Optional[str], Opti
     
     Returns:
         A list of unique tracks sorted by release date (oldest to newest).
-        When multiple versions of a track exist, only the most recent is kept.
     """
-    # Dictionary to store the most recent release for each track name
-    track_dict = {}
-
-    for track in tracks:
-        if len(track) < 5:
-            # Skip malformed track data
-            continue
-            
-        track_id, name, release_date, artist, album = track
-        # If the track is not in the dictionary or the new date is more recent, update it
-        if name not in track_dict or release_date > track_dict[name][2]:
-            track_dict[name] = track
-
-    # Extract the values from the dictionary and convert them back to a list
-    unique_tracks = list(track_dict.values())
-
-    # Sort by release date for clarity (oldest first)
-    unique_tracks.sort(key=lambda x: x[2])
+    # Dictionary insertion order keeps the tracks sorted by release date (oldest first)
+    unique_tracks = {}
+    for track in sorted((track for track in tracks if len(track) >= 5), key=itemgetter(2)):  # Skip malformed track data
+        unique_tracks[track[0]] = track
 
-    return unique_tracks
+    return list(unique_tracks.values())
@@ -10,23 +10,37 @@ It maintains two playlists:
 
 import os
 import json
+import atexit
 import datetime
 import argparse
 import random
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
 
+import requests
 import spotipy
+from requests.adapters import HTTPAdapter
 from spotipy.oauth2 import SpotifyOAuth
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
 from spotipy_utils import (
+    RateLimiter,
+    RateLimitedSpotify,
     get_recent_track,
     get_playlist_tracks,
+    get_track_durations,
     deduplicate_track_list
 )
 
 # Load environment variables from .env file
 load_dotenv(override=True)
 
+# Maximum number of concurrent Spotify API requests
+MAX_WORKERS = 10
+# Maximum sustained rate of Spotify API requests per second
+REQUESTS_PER_SECOND = 10
+
 def parse_arguments():
     """Parse command line arguments."""
     parser = argparse.ArgumentParser(description='Update Spotify playlists with tracks from Threads artists')
@@ -45,6 +59,7 @@ def get_config(args):
         'all_playlist_id': os.environ.get('SPOTIFY_ALL_PLAYLIST_ID'),
         'n_days_ago': int(os.environ.get('DAYS_LOOKBACK', 13)),
         'artists_file': os.environ.get('ARTISTS_FILE', 'artists.json'),
+        'album_cache_file': os.environ.get('ALBUM_CACHE_FILE', 'album_cache.json'),
         'dry_run': args.dry_run,
         'exclude_ai': os.environ.get('EXCLUDE_AI', True)
     }
@@ -63,11 +78,10 @@ def load_artists(file_path, exclude_ai):
     """Load artists from JSON file."""
     try:
         with open(file_path, 'r') as f:
-            artists = json.load(f)
+            # Filter out artists with heavy ai_usage while loading
+            artists = [artist for artist in json.load(f)
+                       if not exclude_ai or artist.get('ai_usage') != 'heavy']
         print(f"Loaded {len(artists)} artists from {file_path}")
-        # remove artists with heavy ai_usage
-        if exclude_ai:
-            artists = [artist for artist in artists if not artist.get('ai_usage') or artist['ai_usage'] != 'heavy']
         return artists
     except FileNotFoundError:
         print(f"Error: Artists file not found at {file_path}")
@@ -76,6 +90,44 @@ def load_artists(file_path, exclude_ai):
         print(f"Error: Invalid JSON in artists file {file_path}")
         exit(1)
 
+def load_album_cache(file_path):
+    """Load the album cache from a JSON file, starting empty if it is missing or invalid."""
+    cache = {}
+    try:
+        with open(file_path, 'r') as f:
+            cache = json.load(f)
+    except FileNotFoundError:
+        pass
+    except json.JSONDecodeError:
+        print(f"Warning: Ignoring invalid album cache file {file_path}")
+    # Only releases from the current year are tracked, so start over each new year
+    current_year = datetime.date.today().year
+    if cache.get('year') != current_year:
+        cache = {'year': current_year}
+    cache.setdefault('artists', {})
+    cache.setdefault('album_tracks', {})
+    cache.setdefault('track_durations', {})
+    return cache
+
+def save_album_cache(cache, file_path):
+    """Save the album cache to a JSON file."""
+    try:
+        # Snapshot the cache first: after an interrupted run, worker threads may
+        # still be adding entries while it is serialized
+        snapshot = {key: dict(value) if isinstance(value, dict) else value for key, value in cache.items()}
+        data = json.dumps(snapshot)
+    except RuntimeError as e:
+        print(f"Warning: Could not save album cache to {file_path}: {e}")
+        return
+    try:
+        # Write to a temporary file first so an interrupted run can't corrupt the cache
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+        os.replace(tmp_path, file_path)
+    except OSError as e:
+        print(f"Warning: Could not save album cache to {file_path}: {e}")
+
 def initialize_spotify_client(client_id, client_secret):
     """Initialize Spotify client with OAuth for playlist modification."""
     try:
@@ -89,8 +141,27 @@ def initialize_spotify_client(client_id, client_secret):
             cache_path='.spotify_token_cache'  # Store the token for reuse
         )
         
+        # Retry server errors in the HTTP session, but not 429 responses: urllib3 would
+        # otherwise sleep on Retry-After inside each thread. Letting them through makes
+        # spotipy raise with the response headers, so the shared rate limiter can
+        # honor Retry-After for every thread at once.
+        retry = Retry(
+            total=3,
+            read=False,
+            status=3,
+            backoff_factor=0.3,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+            respect_retry_after_header=False
+        )
+        session = requests.Session()
+        session.mount('https://', HTTPAdapter(max_retries=retry, pool_maxsize=MAX_WORKERS))
+        
         # Create the Spotify client with the auth manager
-        sp = spotipy.Spotify(auth_manager=auth_manager)
+        sp = RateLimitedSpotify(
+            spotipy.Spotify(auth_manager=auth_manager, requests_session=session),
+            RateLimiter(REQUESTS_PER_SECOND)
+        )
         
         # Check if authentication is needed
         try:
@@ -121,33 +192,43 @@ def initialize_spotify_client(client_id, client_secret):
         print(f"Error initializing Spotify client: {e}")
         exit(1)
 
-def collect_tracks(sp, artists, n_days_ago):
+def collect_tracks(sp, artists, n_days_ago, track_durations=None, album_cache=None, album_tracks_cache=None):
     """Collect tracks from artists."""
     all_playlist_tracks = []
     rr_playlist_tracks = []
     
     print(f"Collecting tracks from {len(artists)} artists...")
     
+    artists_to_fetch = []
     for artist in artists:
         if not artist.get('spotify_id'):
             print(f"Skipping artist without Spotify ID: {artist.get('name', 'Unknown')}")
             continue
-            
-        try:
-            all_tracks, recent_track = get_recent_track(sp, artist, n_days_ago)
-            
-            if recent_track:
-                rr_playlist_tracks.append(recent_track)
+        artists_to_fetch.append(artist)
+    
+    # Fetch artists concurrently; the work is dominated by network round-trips
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = [
+            (artist, executor.submit(
+                get_recent_track, sp, artist, n_days_ago, track_durations, album_cache, album_tracks_cache
+            ))
+            for artist in artists_to_fetch
+        ]
+        for artist, future in futures:
+            try:
+                all_tracks, recent_track = future.result()
                 
-            all_playlist_tracks.extend(all_tracks)
-        except Exception as e:
-            print(f"Error processing artist {artist.get('name')}: {e}")
+                if recent_track:
+                    rr_playlist_tracks.append(recent_track)
+                    
+                all_playlist_tracks.extend(all_tracks)
+            except Exception as e:
+                print(f"Error processing artist {artist.get('name')}: {e}")
     
-    # Sort tracks by release date (newest first)
-    rr_playlist_tracks.sort(key=lambda x: x[2], reverse=True)
-    all_playlist_tracks.sort(key=lambda x: x[2], reverse=True)
+    # Sort recent tracks by release date (newest first)
+    rr_playlist_tracks.sort(key=itemgetter(2), reverse=True)
     
-    # Deduplicate all tracks
+    # Deduplicate all tracks, which also sorts them by release date (oldest first)
     all_playlist_tracks = deduplicate_track_list(all_playlist_tracks)
     
     print(f"Found {len(rr_playlist_tracks)} tracks released in the last {n_days_ago} days")
@@ -161,14 +242,15 @@ def update_playlists(sp, config, rr_playlist_tracks, all_playlist_tracks):
     existing_rr_playlist_tracks = sp.playlist_tracks(config['rr_playlist_id'])['items']
     existing_all_playlist_tracks = get_playlist_tracks(sp, config['all_playlist_id'])
     
-    # Find new tracks to add
-    new_rr_tracks = [track for track in rr_playlist_tracks 
-                     if track[0] not in [existing_track['track']['id'] 
-                                         for existing_track in existing_rr_playlist_tracks]]
+    # Extract track IDs once, and build sets for constant-time membership checks
+    existing_rr_track_ids = [existing_track['track']['id'] for existing_track in existing_rr_playlist_tracks]
+    existing_rr_ids = set(existing_rr_track_ids)
+    existing_all_ids = {existing_track['track']['id'] for existing_track in existing_all_playlist_tracks}
+    new_rr_ids = {track[0] for track in rr_playlist_tracks}
     
-    new_all_tracks = [track for track in all_playlist_tracks 
-                      if track[0] not in [existing_track['track']['id'] 
-                                          for existing_track in existing_all_playlist_tracks]]
+    # Find new tracks to add
+    new_rr_tracks = [track for track in rr_playlist_tracks if track[0] not in existing_rr_ids]
+    new_all_tracks = [track for track in all_playlist_tracks if track[0] not in existing_all_ids]
     
     print(f"{len(new_rr_tracks)} tracks will be added to the recent releases playlist")
     print(f"{len(new_all_tracks)} tracks will be added to the all tracks playlist")
@@ -178,8 +260,7 @@ def update_playlists(sp, config, rr_playlist_tracks, all_playlist_tracks):
         return new_rr_tracks, new_all_tracks
     
     # Find tracks to remove from recent releases playlist
-    old_rr_track_ids = [track['track']['id'] for track in existing_rr_playlist_tracks 
-                        if track['track']['id'] not in [track[0] for track in rr_playlist_tracks]]
+    old_rr_track_ids = [track_id for track_id in existing_rr_track_ids if track_id not in new_rr_ids]
     
     # Remove old tracks from the recent releases playlist
     if old_rr_track_ids:
@@ -208,10 +289,11 @@ def update_playlists(sp, config, rr_playlist_tracks, all_playlist_tracks):
     
     return new_rr_tracks, new_all_tracks
 
-def generate_summary(sp, config, rr_playlist_tracks, new_rr_tracks):
+def generate_summary(sp, config, rr_playlist_tracks, new_rr_tracks, track_durations=None):
     """Generate a summary of the playlist update."""
     # Calculate total duration of the recent releases playlist
-    total_duration = sum([sp.track(track[0])['duration_ms'] for track in rr_playlist_tracks])
+    durations = get_track_durations(sp, [track[0] for track in rr_playlist_tracks], track_durations)
+    total_duration = sum(durations.get(track[0], 0) for track in rr_playlist_tracks)
     total_duration_string = str(datetime.timedelta(milliseconds=total_duration)).split('.')[0]
     total_tracks = len(rr_playlist_tracks)
     
@@ -246,14 +328,23 @@ def main():
     
     # Only print authentication URL if needed (handled in initialize_spotify_client)
     
+    # Load the album cache and persist it when the script exits
+    album_cache = load_album_cache(config['album_cache_file'])
+    atexit.register(save_album_cache, album_cache, config['album_cache_file'])
+    
+    # Durations seen while collecting tracks, reused by the summary
+    track_durations = album_cache['track_durations']
+    
     # Collect tracks from artists
-    rr_playlist_tracks, all_playlist_tracks = collect_tracks(sp, artists, config['n_days_ago'])
+    rr_playlist_tracks, all_playlist_tracks = collect_tracks(
+        sp, artists, config['n_days_ago'], track_durations, album_cache['artists'], album_cache['album_tracks']
+    )
     
     # Update playlists
     new_rr_tracks, new_all_tracks = update_playlists(sp, config, rr_playlist_tracks, all_playlist_tracks)
     
     # Generate summary
-    generate_summary(sp, config, rr_playlist_tracks, new_rr_tracks)
+    generate_summary(sp, config, rr_playlist_tracks, new_rr_tracks, track_durations)
 
 if __name__ == "__main__":
     main()